@@ -13,13 +13,19 @@ from sys import argv
 #pylint: disable=import-error
 import serial_asyncio
 
+_DLE = b'\x10'
+_ESC = b'\x10\x00'
+_HEADER = b'\x10\x02'
+_FOOTER = b'\x10\x03'
+# Consumed bytes are only discarded from the input buffer past this offset
+_COMPACT_THRESHOLD = 4096
+
 class AqualinkProtocol(asyncio.Protocol):
     '''Aqualink RS-485 protocol: chunk aqualink stream data into packets'''
     def __init__(self):
-        self.escape_seq = bytes([0x10, 0x00])
-        self.header = bytes([0x10, 0x02])
-        self.footer = bytes([0x10, 0x03])
         self.input_buf = bytearray()
+        self._head = 0
+        self._data_event = asyncio.Event()
         self.transport = None
         self.closed = False
         super().__init__()
@@ -27,33 +33,62 @@ class AqualinkProtocol(asyncio.Protocol):
     def connection_made(self, transport):
         self.transport = transport
 
+    def connection_lost(self, exc):
+        self.closed = True
+        self._data_event.set()
+
     def data_received(self, data):
         self.input_buf.extend(data)
+        self._data_event.set()
+
+    def close(self):
+        '''Close the transport and wake up anyone waiting for data'''
+        self.closed = True
+        self._data_event.set()
+        self.transport.close()
+
+    async def wait_for_data(self):
+        '''Wait until new bytes arrive or the connection is lost. (asyncio)'''
+        await self._data_event.wait()
+        self._data_event.clear()
 
     def __read(self, n_bytes):
-        read_bytes = self.input_buf[:n_bytes]
-        del self.input_buf[:n_bytes]
+        start = self._head
+        self._head += n_bytes
+
+        return self.input_buf[start:self._head]
 
-        return read_bytes
+    def __compact(self):
+        '''Discard consumed bytes, but only when it is cheap or overdue'''
+        if self._head >= len(self.input_buf):
+            self.input_buf.clear()
+            self._head = 0
+        elif self._head > _COMPACT_THRESHOLD:
+            del self.input_buf[:self._head]
+            self._head = 0
 
     def __packet_search(self):
-        while len(self.input_buf) > len(self.header):
-            pkt_start_idx = self.input_buf.find(self.header)
+        while len(self.input_buf) - self._head > len(_HEADER):
+            pkt_start_idx = self.input_buf.find(_HEADER, self._head)
 
             if pkt_start_idx < 0:
-                # No header was found, so all the bytes are junk. Discard them
+                # No header was found, so all the bytes are junk. Discard them,
+                # except for a trailing DLE that may start the next header
                 pkt_start_idx = len(self.input_buf)
+                if self.input_buf.endswith(_DLE):
+                    pkt_start_idx -= 1
 
-            if pkt_start_idx > 0:
-                dropped_bytes = self.__read(pkt_start_idx)
+            if pkt_start_idx > self._head:
+                dropped_bytes = self.__read(pkt_start_idx - self._head)
                 print(f'Dropping bytes {dropped_bytes.hex(" ")}')
 
-            pkt_footer_idx = self.input_buf.find(self.footer)
+            pkt_footer_idx = self.input_buf.find(_FOOTER, self._head)
             if pkt_footer_idx < 0:
-                return
+                break
 
-            raw_pkt = self.__read(pkt_footer_idx + len(self.footer))
-            pkt = raw_pkt.replace(self.escape_seq, bytes([0x10]))
+            raw_pkt = self.__read(pkt_footer_idx + len(_FOOTER) - self._head)
+            # Most packets carry no escaped bytes. Skip the copy for those
+            pkt = raw_pkt.replace(_ESC, _DLE) if _ESC in raw_pkt else raw_pkt
             csum = sum(pkt[:-3]) & 0xff
             if csum != pkt[-3]:
                 print(f'Invalid checksum {hex(pkt[-3])}. expected {hex(csum)}; {pkt.hex(" ")}')
@@ -61,17 +96,20 @@ class AqualinkProtocol(asyncio.Protocol):
 
             yield pkt[2:-3]
 
+        self.__compact()
+
     def read_packet(self):
         '''Return a generator that spits out complete packets'''
         return self.__packet_search()
 
     def write_packet(self, pkt):
         '''Write a packet. Encoding and checksumming is automatically handled'''
-        csum = (sum(self.header) + sum(pkt)) & 0xff
+        csum = (sum(_HEADER) + sum(pkt)) & 0xff
         # Payload and checksum bytes must be escaped if 0x10
-        rs485_pkt = (pkt + bytes([csum])).replace(bytes([0x10]), self.escape_seq)
-        rs485_pkt = self.header + rs485_pkt + self.footer
-        self.transport.write(rs485_pkt)
+        escaped = pkt + bytes((csum,))
+        if _DLE in escaped:
+            escaped = escaped.replace(_DLE, _ESC)
+        self.transport.write(_HEADER + escaped + _FOOTER)
 
 
 async def main():
@@ -82,9 +120,8 @@ async def main():
     _, protocol = await serial_asyncio.create_serial_connection(loop,
                                     AqualinkProtocol,
                                     tty_path, baudrate=9600)
-    await asyncio.sleep(0.3)
     while not protocol.closed:
-        await asyncio.sleep(0.010)
+        await protocol.wait_for_data()
         for pkt in protocol.read_packet():
             now = datetime.datetime.now()
             print(f'[{now}] {pkt.hex(" ")}')
@@ -10,6 +10,7 @@ import asyncio
 from datetime import datetime
 import pprint
 import signal
+import struct
 
 #pylint: disable=import-error
 import serial_asyncio
@@ -24,6 +25,11 @@ JXI_CTL_HEATER_ON = 0x08
 JXI_CTL_TEMP3_VALID = 0x10
 # Internal timeout (in seconds). Not part of the protocol
 JXI_KEEPALIVE_TIMEOUT=1800
+# Heater mode -> (control bits to set, control bits to clear)
+JXI_MODE_BITS = {
+    "spa" : (JXI_CTL_SPA, JXI_CTL_POOL),
+    "pool" : (JXI_CTL_POOL, JXI_CTL_SPA),
+}
 
 packet_def = {
     0x00 : { "name" : "probe", "fields" : [ ] },
@@ -81,6 +87,21 @@ packet_def = {
     },
 }
 
+FIELD_FORMATS = { 1 : 'B', 2 : 'H' }
+
+def _field_unpackers(fields):
+    '''Little-endian unpackers for each leading run of a packet's fields'''
+    fmt = '<'
+    unpackers = [struct.Struct(fmt)]
+    for _, size, *_ in fields:
+        fmt += FIELD_FORMATS[size]
+        unpackers.append(struct.Struct(fmt))
+
+    return unpackers
+
+for _pdef in packet_def.values():
+    _pdef["_unpackers"] = _field_unpackers(_pdef["fields"])
+
 def ffs(bitfield):
     '''Find index of tghe the first set bit in a bitfield'''
     return (bitfield & -bitfield).bit_length() - 1
@@ -94,19 +115,13 @@ def decode_packet(pkt, big_picture):
         print(f'**** Unexplained {pkt.hex(" ")} ****')
         return
 
-    offset = 2
-    descr = ""
-    for name, size, *xform in pdef["fields"]:
-        if offset + size > len(pkt):
-            break
-
-        value = 0
-        for idx in reversed(range(offset, offset + size)):
-            value = value << 8 | pkt[idx]
-
-        descr += f' {name}={hex(value)}'
-        offset += size
+    # Short packets only carry their leading fields. Decode as many as fit
+    payload_len = len(pkt) - 2
+    unpacker = next(u for u in reversed(pdef["_unpackers"])
+                    if u.size <= payload_len)
 
+    values = unpacker.unpack_from(pkt, 2)
+    for (name, _, *xform), value in zip(pdef["fields"], values):
         if name.startswith('?'):
             continue
 
@@ -167,7 +182,7 @@ class Heater(AqualinkProtocol):
     async def decoder_loop(self, monitor_only):
         '''Decode incoming packets until closed. (asyncio)'''
         while not self.closed:
-            await asyncio.sleep(0.3)
+            await self.wait_for_data()
             for pkt in self.read_packet():
                 decode_packet(pkt, self._status)
                 if monitor_only:
@@ -246,12 +261,9 @@ class Heater(AqualinkProtocol):
             verb = verbs.pop(0)
             msg = None
 
-            if verb == "spa":
-                self._ctl_byte &= ~JXI_CTL_POOL
-                self._ctl_byte |= JXI_CTL_SPA
-            elif verb == "pool":
-                self._ctl_byte |= JXI_CTL_POOL
-                self._ctl_byte &= ~JXI_CTL_SPA
+            if verb in JXI_MODE_BITS:
+                set_bits, clear_bits = JXI_MODE_BITS[verb]
+                self._ctl_byte = (self._ctl_byte | set_bits) & ~clear_bits
             elif verb == "on":
                 self._main_heater_turn_on()
                 msg = f"Staring heater. Timeout in {JXI_KEEPALIVE_TIMEOUT} sec."
@@ -299,10 +311,9 @@ class Heater(AqualinkProtocol):
 
         writer.close()
 
-    def signal_shutdown(self, _, __):
-        '''Signal handler to be used with signal.signal()'''
-        self.closed = True
-        self.transport.close()
+    def signal_shutdown(self):
+        '''Signal handler to be used with loop.add_signal_handler()'''
+        self.close()
 
 
 async def main(args):
@@ -331,7 +342,7 @@ async def main(args):
     if not args.disable_rts_on_send:
         heater.transport.serial.rs485_mode = rs485_settings
 
-    signal.signal(signal.SIGINT, heater.signal_shutdown)
+    loop.add_signal_handler(signal.SIGINT, heater.signal_shutdown)
 
     await asyncio.sleep(0.3)
     await asyncio.gather(